@@ -0,0 +1,18 @@
+import datetime
+
+
+def parse_iso_date(date_str):
+    """Parse date string in YYYY-MM-DD format to a UTC datetime object."""
+    if not date_str:
+        return None
+    try:
+        # Parsed by hand rather than with strptime, which imports the _strptime module on first use
+        year, month, day = date_str.split("-")
+        # int() also accepts whitespace, signs and underscores, which strptime("%Y-%m-%d") rejects
+        if not (len(year) == 4 and 1 <= len(month) <= 2 and 1 <= len(day) <= 2):
+            raise ValueError
+        if not all(part.isascii() and part.isdigit() for part in (year, month, day)):
+            raise ValueError
+        return datetime.datetime(int(year), int(month), int(day), tzinfo=datetime.timezone.utc)
+    except ValueError:
+        raise ValueError(f"Invalid date format: {date_str}. Expected YYYY-MM-DD format.")
@@ -0,0 +1,12 @@
+import sys
+
+
+def install_uvloop():
+    """Use uvloop as the asyncio event loop when it is installed (it does not support Windows)."""
+    if sys.platform == "win32":
+        return
+    try:
+        import uvloop
+    except ImportError:
+        return
+    uvloop.install()
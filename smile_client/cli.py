@@ -14,37 +14,28 @@ Options:
   --debug                   Set logging level to DEBUG [optional].
 
 """
-import json
 import logging
 import asyncio
-import datetime
+import orjson
 from docopt import docopt
 from smile_client import __version__
 from .smile_client import SmileClient
+from ._dates import parse_iso_date
+from ._loop import install_uvloop
 
 
 def load_config(config_file):
     """Load configuration from JSON file."""
-    with open(config_file, 'r') as f:
-        return json.load(f)
-
-
-def parse_start_date(date_str):
-    """Parse date string in YYYY-MM-DD format to datetime object."""
-    if not date_str:
-        return None
-    try:
-        date_obj = datetime.datetime.strptime(date_str, "%Y-%m-%d")
-        return date_obj.replace(tzinfo=datetime.timezone.utc, hour=0, minute=0, second=0, microsecond=0)
-    except ValueError:
-        raise ValueError(f"Invalid date format: {date_str}. Expected YYYY-MM-DD format.")
+    with open(config_file, 'rb') as f:
+        return orjson.loads(f.read())
 
 
 def start_listener(config_file, subject, start_date=None):
     """Start the listener with the given config file, subject and optional start date."""
     config = load_config(config_file)
     client = SmileClient(config)
-    parsed_start_date = parse_start_date(start_date)
+    parsed_start_date = parse_iso_date(start_date)
+    install_uvloop()
     asyncio.run(client.start_consuming(subject, start_date=parsed_start_date))
 
 
@@ -3,11 +3,14 @@ import logging
 from smile_client.messages.smile_message import SmileMessage
 
 logger = logging.getLogger("smile_client")
+# Bound once to skip the attribute lookups on every message
+_log_info = logger.info
+_log_error = logger.error
 
 
 def smile_callback(msg: SmileMessage):
     try:
-        logger.info("Received a message on '{subject}': {data}".format(subject=msg.subject, data=msg.data))
+        _log_info("Received a message on '%s': %s", msg.subject, msg.data)
     except Exception as e:
-        logger.error(f"Error processing message: {e}")
+        _log_error("Error processing message: %s", e)
         raise
\ No newline at end of file
@@ -1,7 +1,8 @@
 import asyncio
-import datetime
 import logging
 from smile_client import SmileClient
+from smile_client._dates import parse_iso_date
+from smile_client._loop import install_uvloop
 from django.core.management.base import BaseCommand, CommandError
 
 logger = logging.getLogger("smile_client")
@@ -14,28 +15,24 @@ class Command(BaseCommand):
         parser.add_argument("--subject", type=str, required=True, help="NATS subject to consume from")
         parser.add_argument("--start-date", type=str, help="Start date in YYYY-MM-DD format")
 
-    def parse_start_date(self, date_str):
-        """Parse date string in YYYY-MM-DD format to datetime object."""
-        if not date_str:
-            return None
-        try:
-            date_obj = datetime.datetime.strptime(date_str, "%Y-%m-%d")
-            return date_obj.replace(tzinfo=datetime.timezone.utc, hour=0, minute=0, second=0, microsecond=0)
-        except ValueError:
-            raise CommandError(f"Invalid date format: {date_str}. Expected YYYY-MM-DD format.")
-
     def handle(self, *args, **options):
         subject = options["subject"]
         start_date = options.get("start_date")
 
+        try:
+            parsed_start_date = parse_iso_date(start_date)
+        except ValueError as e:
+            raise CommandError(str(e))
+
         try:
             client = SmileClient()
-            parsed_start_date = self.parse_start_date(start_date)
             
             self.stdout.write(self.style.SUCCESS(f"Starting Smile Consumer with subject: {subject}"))
             if parsed_start_date:
                 self.stdout.write(self.style.SUCCESS(f"Start date: {parsed_start_date}"))
-            
+
+            install_uvloop()
+
             asyncio.run(client.start_consuming(subject, start_date=parsed_start_date))
         except Exception as e:
             logger.error(f"Error: {e}")
@@ -1,4 +1,5 @@
 class SmileMessage(object):
+    __slots__ = ("subject", "data")
 
     def __init__(self, subject, data):
         self.subject = subject
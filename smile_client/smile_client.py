@@ -1,19 +1,26 @@
-import ssl
-import json
-import nats
+import sys
+import inspect
+import orjson
 import logging
 import asyncio
 import signal
-from django.conf import settings
-from importlib import import_module
-
-from nats.js.api import ConsumerConfig, DeliverPolicy
-from nats.errors import ConnectionClosedError, TimeoutError, NoServersError
+import functools
+import concurrent.futures
 
 from smile_client.messages.smile_message import SmileMessage
 
 logger = logging.getLogger("smile_client")
 
+# Resolved handlers keyed by their dotted path, shared by all clients
+_HANDLER_CACHE = {}
+
+
+@functools.lru_cache(maxsize=1024)
+def _parse_cached(data: bytes):
+    """Memoized orjson.loads; the returned object is shared between messages and must not be mutated"""
+    return orjson.loads(data)
+
+
 class SmileClient(object):
 
     def __init__(self, connection_params: object = None):
@@ -27,11 +34,28 @@ class SmileClient(object):
             "NATS_SSL_KEYFILE": <ssl_keyfile>,
             "NATS_ROOT_CA": <root_ca>,
             "NATS_FILTER_SUBJECT": <filter_subject>,
+            "NATS_FILTER_SUBJECTS": [<filter_subject>, ...],
             "NATS_DURABLE": <nats_durable>,
             "CLIENT_TIMEOUT": <client_timeout>,
+            "NATS_FETCH_BATCH": <fetch_batch>,
+            "NATS_FETCH_TIMEOUT": <fetch_timeout>,
+            "NATS_ACK_EXPLICIT": <ack_explicit>,
+            "NATS_MAX_IN_FLIGHT_ACKS": <max_in_flight_acks>,
+            "NATS_CALLBACK_CONCURRENCY": <callback_concurrency>,
+            "LOG_PAYLOAD": <log_payload>,
+            "CACHE_PARSED_PAYLOADS": <cache_parsed_payloads>,
+            "NATS_MAX_ACK_PENDING": <max_ack_pending>,
+            "NATS_MAX_DELIVER": <max_deliver>,
+            "NATS_ACK_WAIT": <ack_wait>,
+            "PREFILTER": <prefilter>,
         }
         """
-        smile_settings = connection_params if connection_params else getattr(settings, "SMILE_SETTINGS")
+        if connection_params:
+            smile_settings = connection_params
+        else:
+            # Deferred so the standalone CLI never pays for importing Django
+            from django.conf import settings
+            smile_settings = getattr(settings, "SMILE_SETTINGS")
         self.servers = smile_settings.get("NATS_URL")
         self.user = smile_settings.get("NATS_USERNAME")
         self.password = smile_settings.get("NATS_PASSWORD")
@@ -39,33 +63,103 @@ class SmileClient(object):
         self.ssl_keyfile = smile_settings.get("NATS_SSL_KEYFILE")
         self.nats_durable = smile_settings.get("NATS_DURABLE")
         self.filter_subject = smile_settings.get("NATS_FILTER_SUBJECT")
+        self.filter_subjects = smile_settings.get("NATS_FILTER_SUBJECTS")
+        if self.filter_subject and self.filter_subjects:
+            raise ValueError("NATS_FILTER_SUBJECT and NATS_FILTER_SUBJECTS are mutually exclusive")
+        if self.filter_subjects is not None and not isinstance(self.filter_subjects, (list, tuple)):
+            raise ValueError("NATS_FILTER_SUBJECTS must be a list of subjects")
         self.nats_root_ca = smile_settings.get("NATS_ROOT_CA")
         self.client_timeout = smile_settings.get("CLIENT_TIMEOUT", 3600.0)
+        self.fetch_batch = smile_settings.get("NATS_FETCH_BATCH", 100)
+        self.fetch_timeout = smile_settings.get("NATS_FETCH_TIMEOUT", 1.0)
+        self.ack_explicit = smile_settings.get("NATS_ACK_EXPLICIT", False)
+        self.max_in_flight_acks = smile_settings.get("NATS_MAX_IN_FLIGHT_ACKS", 100)
+        self.callback_concurrency = smile_settings.get("NATS_CALLBACK_CONCURRENCY", 1)
+        if self.max_in_flight_acks < 1:
+            raise ValueError("NATS_MAX_IN_FLIGHT_ACKS must be at least 1")
+        if self.callback_concurrency < 1:
+            raise ValueError("NATS_CALLBACK_CONCURRENCY must be at least 1")
+        self.log_payload = smile_settings.get("LOG_PAYLOAD", True)
+        self.cache_parsed_payloads = smile_settings.get("CACHE_PARSED_PAYLOADS", False)
+        self.max_ack_pending = smile_settings.get("NATS_MAX_ACK_PENDING", 10000)
+        self.max_deliver = smile_settings.get("NATS_MAX_DELIVER")
+        self.ack_wait = smile_settings.get("NATS_ACK_WAIT")
         self.handler_path = smile_settings.get('CALLBACK', "smile_client.default_callback.smile_callback")
+        self._callback = self.get_handler(self.handler_path)
+        self.prefilter_path = smile_settings.get("PREFILTER")
+        self._prefilter = self.get_handler(self.prefilter_path) if self.prefilter_path else None
+
+        # Connection and consumer settings that do not change between connect attempts
+        self._base_options = {
+            "servers": self.servers,
+            "user": self.user,
+            "password": self.password,
+            "max_reconnect_attempts": -1,
+            "reconnect_time_wait": 30,
+        }
+        self._base_consumer_cfg = {
+            "ack_policy": "explicit" if self.ack_explicit else "all",
+            "max_ack_pending": self.max_ack_pending,
+            "max_deliver": self.max_deliver,
+            "ack_wait": self.ack_wait,
+        }
+        if self.filter_subjects:
+            # Multi-subject filtering requires nats-server 2.10+
+            self._base_consumer_cfg["filter_subjects"] = list(self.filter_subjects)
+        else:
+            self._base_consumer_cfg["filter_subject"] = self.filter_subject
+
+        self.nc = None
+        self.sub = None
         self._stop_event = asyncio.Event()
+        self._executor = None
+        self._ssl_ctx = None
+        self._fetch_task = None
+        self._ack_all = not self.ack_explicit
+        self._in_progress_interval = 15.0
 
     @staticmethod
     def get_handler(handler_path) -> callable:
         """Dynamically import and return the handler function for a queue"""
+        handler = _HANDLER_CACHE.get(handler_path)
+        if handler is not None:
+            return handler
+
         try:
             module_path, handler_name = handler_path.rsplit('.', 1)
-            module = import_module(module_path)
+            module = sys.modules.get(module_path)
+            if module is None:
+                from importlib import import_module
+                module = import_module(module_path)
             handler = getattr(module, handler_name)
 
             if not callable(handler):
                 raise ValueError(f"Handler {handler_path} is not callable")
 
+            _HANDLER_CACHE[handler_path] = handler
             return handler
         except (ImportError, AttributeError) as e:
             raise ValueError(f"Could not import handler {handler_path}: {str(e)}")
 
+    def _build_ssl_ctx(self):
+        """Return the TLS context for the configured certificates, building it on first use"""
+        import ssl
+
+        if self._ssl_ctx is None:
+            ssl_ctx = ssl.create_default_context(purpose=ssl.Purpose.SERVER_AUTH)
+            if self.nats_root_ca:
+                ssl_ctx.load_verify_locations(cafile=self.nats_root_ca)
+            ssl_ctx.load_cert_chain(certfile=self.ssl_certfile, keyfile=self.ssl_keyfile)
+            self._ssl_ctx = ssl_ctx
+        return self._ssl_ctx
+
     async def connect(self, subject, start_time=None):
+        import nats
+        from nats.js.api import AckPolicy, ConsumerConfig, DeliverPolicy
+        from nats.js.errors import NotFoundError
+
         options = {
-            "servers": self.servers,
-            "user": self.user,
-            "password": self.password,
-            "max_reconnect_attempts": -1,
-            "reconnect_time_wait": 30,
+            **self._base_options,
             "error_cb": self._on_error,
             "disconnected_cb": self._on_disconnected,
             "reconnected_cb": self._on_reconnected,
@@ -73,19 +167,13 @@ class SmileClient(object):
         }
 
         if self.ssl_certfile and self.ssl_keyfile:
-            ssl_ctx = ssl.create_default_context(purpose=ssl.Purpose.SERVER_AUTH)
-            if self.nats_root_ca:
-                ssl_ctx.load_verify_locations(cafile=self.nats_root_ca)
-            ssl_ctx.load_cert_chain(certfile=self.ssl_certfile, keyfile=self.ssl_keyfile)
-            options["tls"] = ssl_ctx
+            options["tls"] = self._build_ssl_ctx()
 
+        nc = None
         try:
             nc = await nats.connect(**options)
 
-            config = {
-                "filter_subject": self.filter_subject,
-                "ack_policy": "explicit",
-            }
+            config = dict(self._base_consumer_cfg)
             if start_time:
                 config["deliver_policy"] = DeliverPolicy.BY_START_TIME
                 config["opt_start_time"] = start_time
@@ -96,15 +184,68 @@ class SmileClient(object):
 
             js = nc.jetstream()
 
-            sub = await js.subscribe(subject, durable=self.nats_durable, config=cfg)
+            if self.filter_subjects:
+                # pull_subscribe would set filter_subject to the subscribed subject on creation, which the
+                # server rejects alongside filter_subjects; create the consumer ourselves and bind to it instead
+                # Like pull_subscribe, an existing durable is bound as-is; add_consumer would try to update it
+                stream = await js.find_stream_name_by_subject(subject)
+                consumer = None
+                if self.nats_durable:
+                    try:
+                        consumer = await js.consumer_info(stream, self.nats_durable)
+                    except NotFoundError:
+                        pass
+                if consumer is None:
+                    consumer = await js.add_consumer(
+                        stream, config=cfg, name=self.nats_durable, durable_name=self.nats_durable
+                    )
+                sub = await js.pull_subscribe_bind(durable=self.nats_durable, name=consumer.name, stream=stream)
+            else:
+                sub = await js.pull_subscribe(subject, durable=self.nats_durable, config=cfg)
+
+            # An existing durable keeps its original config, and a push consumer cannot serve fetch()
+            info = await sub.consumer_info()
+            if info.config.deliver_subject:
+                raise ValueError(
+                    f"Consumer {info.name} is a push consumer (deliver_subject={info.config.deliver_subject}); "
+                    "SmileClient requires a pull consumer. Use a new NATS_DURABLE or delete the existing consumer."
+                )
+            self._ack_all = not self.ack_explicit and info.config.ack_policy == AckPolicy.ALL
+            if not self.ack_explicit and not self._ack_all:
+                logger.warning(
+                    "Consumer %s uses ack_policy=%s, not 'all'; falling back to per-message acks",
+                    info.name, info.config.ack_policy,
+                )
+            # Acks are sent once a whole batch is handled, so unacked messages are kept alive at half the ack wait
+            # (the server default is 30s)
+            self._in_progress_interval = (info.config.ack_wait or 30.0) / 2
+            for key in ("max_ack_pending", "max_deliver", "ack_wait"):
+                wanted = self._base_consumer_cfg[key]
+                actual = getattr(info.config, key)
+                if wanted is not None and wanted != actual:
+                    logger.warning(
+                        "Consumer %s has %s=%s, configured %s is ignored for existing durables",
+                        info.name, key, actual, wanted,
+                    )
+
             logger.info(f"Connected to NATS at {self.servers}")
             return nc, sub
         except Exception as e:
             logger.error(f"Failed to connect to NATS: {e}")
+            if nc:
+                await nc.close()
             raise
 
     async def _disconnect(self):
         try:
+            # Any prefetched batch is left unacked and will be redelivered
+            if self._fetch_task:
+                if not self._fetch_task.done():
+                    self._fetch_task.cancel()
+                elif not self._fetch_task.cancelled():
+                    self._fetch_task.exception()
+                self._fetch_task = None
+
             if self.sub:
                 await self.sub.unsubscribe()
                 self.sub = None
@@ -115,17 +256,46 @@ class SmileClient(object):
                 self.nc = None
                 logger.info("Disconnected from NATS")
 
+            if self._executor:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
         except Exception as e:
             logger.error(f"Error during disconnect: {e}")
 
+    async def _keep_in_progress(self, msgs):
+        """Reset the ack timer of the batch being handled, and of any prefetched batch, until cancelled"""
+        while True:
+            await asyncio.sleep(self._in_progress_interval)
+            pending = list(msgs)
+            fetch_task = self._fetch_task
+            if fetch_task and fetch_task.done() and not fetch_task.cancelled() and fetch_task.exception() is None:
+                pending.extend(fetch_task.result())
+            await asyncio.gather(*(msg.in_progress() for msg in pending))
+
+    async def _ack(self, msgs):
+        """Ack a processed batch: only the last message under AckPolicy.ALL, every message otherwise"""
+        if not msgs:
+            return
+        if self._ack_all:
+            await msgs[-1].ack()
+            return
+        for i in range(0, len(msgs), self.max_in_flight_acks):
+            await asyncio.gather(*(msg.ack() for msg in msgs[i:i + self.max_in_flight_acks]))
+
     def _setup_signal_handlers(self):
-        """Setup signal handlers for graceful shutdown"""
-        def signal_handler(signum, frame):
+        """Setup signal handlers for graceful shutdown, run by the event loop between iterations"""
+        def signal_handler(signum):
             logger.info(f"Received signal {signum}, initiating shutdown...")
             self._stop_event.set()
 
-        signal.signal(signal.SIGINT, signal_handler)
-        signal.signal(signal.SIGTERM, signal_handler)
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, signal_handler, signum)
+            except NotImplementedError:
+                # Windows event loops do not support add_signal_handler
+                signal.signal(signum, lambda s, frame: loop.call_soon_threadsafe(signal_handler, s))
 
     async def _on_error(self, e):
         logger.error("NATS internal error: %s", e)
@@ -142,29 +312,83 @@ class SmileClient(object):
         self._stop_event.set()
 
     async def start_consuming(self, subject, start_date):
+        from nats.errors import TimeoutError
 
         self._setup_signal_handlers()
 
-        callback = self.get_handler(self.handler_path)
+        callback = self._callback
+        prefilter = self._prefilter
+        is_coroutine_callback = inspect.iscoroutinefunction(callback)
+        parse = _parse_cached if self.cache_parsed_payloads else orjson.loads
+        log_error = logger.error
+        loop = asyncio.get_running_loop()
+        # Each worker runs at most one handler at a time, so one thread per worker is enough
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.callback_concurrency)
 
-        def wrapped_callback(message):
+        async def wrapped_callback(message):
             try:
                 msg_subject = message.subject
-                data = json.loads(message.data.decode())
+                # Skipped messages are still covered by the batch ack
+                if prefilter and not prefilter(msg_subject):
+                    return
+                data = parse(message.data)
                 smile_message_object = SmileMessage(msg_subject, data)
-                callback(smile_message_object)
-            except json.JSONDecodeError:
-                logger.error(f"Invalid JSON received: {message}")
+                if is_coroutine_callback:
+                    await callback(smile_message_object)
+                else:
+                    # Run blocking handlers off the event loop so NATS reads keep flowing
+                    await loop.run_in_executor(self._executor, callback, smile_message_object)
+            except orjson.JSONDecodeError:
+                if self.log_payload:
+                    log_error("Invalid JSON received: %s", message)
+                else:
+                    log_error("Invalid JSON received on '%s'", message.subject)
             except Exception as e:
-                logger.error(f"Error processing message: {e}")
+                log_error("Error processing message: %s", e)
 
-        while not self._stop_event.is_set():
+        queue = asyncio.Queue(maxsize=2 * self.callback_concurrency)
+
+        async def worker():
+            while True:
+                message = await queue.get()
+                try:
+                    await wrapped_callback(message)
+                finally:
+                    queue.task_done()
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.callback_concurrency)]
+
+        try:
+            # Connect once; dropped connections are re-established by the NATS client (max_reconnect_attempts=-1)
             self.nc, self.sub = await self.connect(subject, start_date)
             logger.info("Starting consumer...")
 
-            async for msg in self.sub.messages:
-                wrapped_callback(msg)
-                await msg.ack()
+            self._fetch_task = asyncio.create_task(self.sub.fetch(batch=self.fetch_batch, timeout=self.fetch_timeout))
+            while not self._stop_event.is_set():
+                try:
+                    msgs = await self._fetch_task
+                except TimeoutError:
+                    msgs = []
+                # Request the next batch before processing this one so the fetch round-trip overlaps callback work
+                self._fetch_task = asyncio.create_task(
+                    self.sub.fetch(batch=self.fetch_batch, timeout=self.fetch_timeout)
+                )
+                if not msgs:
+                    continue
+
+                # Stop the server redelivering messages whose handling outlasts ack_wait
+                keep_alive = asyncio.create_task(self._keep_in_progress(msgs))
+                try:
+                    for msg in msgs:
+                        await queue.put(msg)
+                    # Wait for the whole batch before acking so AckPolicy.ALL never acks unprocessed messages
+                    await queue.join()
+                finally:
+                    keep_alive.cancel()
+                await self._ack(msgs)
 
-        logger.info("Shutdown event received, stopping consumer...")
-        await self._disconnect()
+            logger.info("Shutdown event received, stopping consumer...")
+        finally:
+            for task in workers:
+                task.cancel()
+            await self._disconnect()